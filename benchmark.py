@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Offline load test for working_bot.py
+
+Starts fake Telegram, Ollama and OpenRouter servers (see fake_services.py),
+points the bot at them, replays a weighted mix of commands at a target rate
+and reports throughput plus p50/p95/p99 handler latency.
+
+By default updates are processed sequentially, like the production bot
+(concurrent_updates=False); --concurrency N measures an N-way setup instead.
+Non-blocking handlers (block=False) are timed until they finish, not until
+they are dispatched.
+
+Usage:
+    python benchmark.py --rate 50 --updates 500 --mix llama:6,start:1,test:2,status:1
+    python benchmark.py --concurrency 16 --token-latency 0.01 --output bench_output.json
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.ext import CommandHandler, TypeHandler
+
+from fake_services import FakeOllamaServer, FakeOpenRouterServer, FakeTelegramServer
+from media_download import memory_budget
+from resilience import breakers
+import tracing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_TOKEN = "123456:BENCHMARK-TOKEN"
+
+# Argument variants sent with each command in the replayed mix (picked at random)
+COMMAND_ARGS = {
+    # Paraphrase pairs score >= 0.92 cosine with the fake embedder, so they exercise the semantic path
+    "llama": [
+        "what is the capital of France?",
+        "what is the capital city of France?",
+        "explain python asyncio in simple words",
+        "please explain python asyncio in simple words",
+        "write a haiku about autumn rain",
+        "write a short haiku about autumn rain",
+        "how do I reverse a list in python",
+        "how do I reverse a python list",
+    ],
+}
+
+
+# Commands sent as a reply to a fake voice message of --voice-size bytes
+VOICE_COMMANDS = {"voice_openrouter"}
+
+
+def parse_mix(spec: str) -> dict:
+    """Parse 'llama:6,start:1' into {'llama': 6.0, 'start': 1.0}"""
+    mix = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition(":")
+        mix[name.lstrip("/")] = float(weight or 1)
+    if not mix:
+        raise ValueError("Update mix is empty")
+    return mix
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values) -> dict:
+    """Latency summary in milliseconds"""
+    ms = [v * 1000 for v in values]
+    return {
+        "count": len(ms),
+        "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50": round(percentile(ms, 50), 3),
+        "p95": round(percentile(ms, 95), 3),
+        "p99": round(percentile(ms, 99), 3),
+        "max": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def git_commit() -> str:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+        return result.stdout.strip() or "unknown"
+    except FileNotFoundError:
+        return "unknown"
+
+
+async def run_benchmark(args) -> dict:
+    """Run one benchmark round and return the JSON-serializable report"""
+    import working_bot
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    telegram = await FakeTelegramServer(BENCH_TOKEN, api_latency=args.telegram_latency).start()
+    ollama = await FakeOllamaServer(tokens=args.tokens, token_latency=args.token_latency,
+                                    load_latency=args.load_latency, error_rate=args.ollama_error_rate,
+                                    stall=args.ollama_stall).start()
+    openrouter = await FakeOpenRouterServer(latency=args.openrouter_latency).start()
+
+    working_bot.LLAMA_API_URL = ollama.url
+    working_bot.OPENROUTER_API_URL = openrouter.api_url
+    working_bot.OPENROUTER_API_KEY = "bench-key"
+    if args.no_semantic_cache:
+        # Every /llama reaches generation, so --token-latency / --load-latency show up in the results
+        working_bot.SEMANTIC_CACHE_ENABLED = False
+        working_bot.model_manager.embed_models = []
+
+    application = working_bot.build_application(
+        token=BENCH_TOKEN, base_url=telegram.base_url, base_file_url=telegram.base_file_url,
+        concurrent_updates=args.concurrency or False
+    )
+
+    started = {}
+    handler_latency = defaultdict(list)
+    llama_latency = defaultdict(list)       # "cached" / "generated" / "other" -> seconds
+    llama_paths = {}                        # update_id -> path, filled from the finished trace
+    e2e_latency = defaultdict(list)
+    errors = defaultdict(int)
+    done = asyncio.Event()
+    completed = 0
+
+    def command_of(update: Update) -> str:
+        text = (update.message.text if update.message else "") or ""
+        return text.split()[0].lstrip("/") if text else "unknown"
+
+    async def mark_start(update: Update, context) -> None:
+        started[update.update_id] = time.perf_counter()
+
+    def finish(update: Update) -> None:
+        nonlocal completed
+        now = time.perf_counter()
+        command = command_of(update)
+        handler_latency[command].append(now - started.pop(update.update_id, now))
+        if command == "llama":
+            llama_latency[llama_paths.pop(update.update_id, "other")].append(handler_latency[command][-1])
+        e2e_latency[command].append(now - telegram.enqueued_at.pop(update.update_id, now))
+        completed += 1
+        if completed >= args.updates:
+            done.set()
+
+    async def mark_end(update: Update, context) -> None:
+        if command_of(update) not in background_commands:
+            finish(update)
+
+    def timed(callback):
+        """Finish a block=False handler's measurement when it completes, not at dispatch"""
+
+        @functools.wraps(callback)
+        async def wrapper(update: Update, context):
+            try:
+                return await callback(update, context)
+            finally:
+                finish(update)
+
+        return wrapper
+
+    def record_trace(root) -> None:
+        """Classify each /llama by the path its trace took, then log it as usual"""
+        if root.attrs.get("command") == "llama":
+            children = {child.name: child for child in root.children}
+            lookup = children.get("semantic_cache.lookup")
+            if lookup is not None and lookup.attrs.get("hit"):
+                path = "cached"
+            elif "ollama.generate" in children:
+                path = "generated"
+            else:
+                path = "other"
+            llama_paths[root.attrs.get("update_id")] = path
+        original_record_trace(root)
+
+    original_record_trace = tracing.record_trace
+    tracing.record_trace = record_trace
+
+    background_commands = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CommandHandler) and handler.block is False:
+                handler.callback = timed(handler.callback)
+                background_commands.update(handler.commands)
+
+    async def count_error(update, context) -> None:
+        command = command_of(update) if isinstance(update, Update) else "unknown"
+        errors[command] += 1
+
+    application.add_handler(TypeHandler(Update, mark_start), group=-1)
+    application.add_handler(TypeHandler(Update, mark_end), group=1)
+    application.add_error_handler(count_error)
+
+    commands = list(mix)
+    weights = [mix[c] for c in commands]
+    interval = 1.0 / args.rate
+
+    async with application:
+        await application.start()
+        if args.warmup:
+            started_warmup = time.perf_counter()
+            await working_bot.model_manager.preload()
+            print(f"🔥 Model warm-up took {time.perf_counter() - started_warmup:.2f}s")
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+
+        print(f"🚀 Replaying {args.updates} updates at {args.rate}/s (mix: {args.mix})")
+        t0 = time.perf_counter()
+        for i in range(args.updates):
+            # Open-loop schedule: late sends don't push back later ones
+            delay = t0 + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            command = rng.choices(commands, weights)[0]
+            telegram.push_command(command, rng.choice(COMMAND_ARGS.get(command, [""])), chat_id=1 + i % args.chats,
+                                  user_id=1 + i % args.chats,
+                                  reply_voice_size=args.voice_size if command in VOICE_COMMANDS else 0)
+        sent_elapsed = time.perf_counter() - t0
+
+        try:
+            await asyncio.wait_for(done.wait(), args.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Drain timeout: {completed}/{args.updates} updates completed")
+        elapsed = time.perf_counter() - t0
+
+        await application.updater.stop()
+        await application.stop()
+
+    tracing.record_trace = original_record_trace
+    for server in (telegram, ollama, openrouter):
+        await server.stop()
+
+    all_handler = [v for values in handler_latency.values() for v in values]
+    all_e2e = [v for values in e2e_latency.values() for v in values]
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {
+            "rate": args.rate,
+            "updates": args.updates,
+            "mix": mix,
+            "concurrency": args.concurrency,
+            # False matches production; anything else measures a setup the bot doesn't run
+            "concurrent_updates": args.concurrency or False,
+            "chats": args.chats,
+            "tokens": args.tokens,
+            "token_latency": args.token_latency,
+            "load_latency": args.load_latency,
+            "ollama_error_rate": args.ollama_error_rate,
+            "ollama_stall": args.ollama_stall,
+            "telegram_latency": args.telegram_latency,
+            "openrouter_latency": args.openrouter_latency,
+            "voice_size": args.voice_size,
+            "seed": args.seed,
+            "warmup": args.warmup,
+            "semantic_cache": not args.no_semantic_cache,
+        },
+        "sent": args.updates,
+        "completed": completed,
+        "errors": dict(errors),
+        "send_rate": round(args.updates / sent_elapsed, 3) if sent_elapsed else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(completed / elapsed, 3) if elapsed else 0.0,
+        "handler_latency_ms": summarize(all_handler),
+        "e2e_latency_ms": summarize(all_e2e),
+        "per_command": {cmd: {"handler_latency_ms": summarize(values),
+                              "e2e_latency_ms": summarize(e2e_latency[cmd])}
+                        for cmd, values in sorted(handler_latency.items())},
+        # /llama split by whether the answer came from the semantic cache or from generation
+        "llama_latency_ms": {path: summarize(values) for path, values in sorted(llama_latency.items())},
+        "semantic_cache": {model: {"hits": cache.hits, "exact_hits": cache.exact_hits,
+                                   "misses": cache.misses, "entries": len(cache)}
+                           for model, cache in working_bot.llama_caches.items()},
+        "breakers": {name: breaker.state for name, breaker in breakers.items()},
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        "media_budget_peak_bytes": memory_budget.peak,
+        "backend_calls": {
+            "telegram": dict(telegram.stats),
+            "ollama": dict(ollama.stats),
+            "openrouter": dict(openrouter.stats),
+        },
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline load test for the Telegram bot")
+    parser.add_argument("--rate", type=float, default=20.0, help="Target updates per second")
+    parser.add_argument("--updates", type=int, default=200, help="Number of updates to replay")
+    parser.add_argument("--mix", default="llama:6,start:1,test:2,status:1",
+                        help="Weighted command mix, e.g. llama:6,start:1")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="Concurrent updates processed by the application "
+                             "(0 = sequential, as in production)")
+    parser.add_argument("--chats", type=int, default=50, help="Number of distinct simulated chats")
+    parser.add_argument("--tokens", type=int, default=40, help="Tokens per fake Ollama answer")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds per Ollama token")
+    parser.add_argument("--load-latency", type=float, default=0.0, help="Ollama cold model load delay (s)")
+    parser.add_argument("--ollama-error-rate", type=float, default=0.0,
+                        help="Share of Ollama requests that fail with HTTP 500")
+    parser.add_argument("--ollama-stall", type=float, default=0.0,
+                        help="Seconds a failing Ollama request hangs before erroring")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Bot API call delay (s)")
+    parser.add_argument("--voice-size", type=int, default=256 * 1024,
+                        help="Bytes per fake voice message for voice commands")
+    parser.add_argument("--openrouter-latency", type=float, default=0.05, help="OpenRouter delay (s)")
+    parser.add_argument("--drain-timeout", type=float, default=60.0,
+                        help="Seconds to wait for in-flight updates after the last send")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Preload models through the model manager before replaying")
+    parser.add_argument("--no-semantic-cache", action="store_true",
+                        help="Disable the /llama semantic cache so every request is generated")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the update mix")
+    parser.add_argument("--output", default="bench_output.json", help="Where to write the JSON report")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.rate <= 0 or args.updates <= 0:
+        print("❌ --rate and --updates must be positive")
+        sys.exit(2)
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(run_benchmark(args))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    latency = report["handler_latency_ms"]
+    print("=" * 50)
+    if args.concurrency:
+        print(f"⚠️ Measured with concurrent_updates={args.concurrency}; production processes updates sequentially")
+    print(f"📊 Throughput: {report['throughput_per_s']} updates/s "
+          f"({report['completed']}/{report['sent']} completed)")
+    print(f"⏱️ Handler latency p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms")
+    if report["errors"]:
+        print(f"❌ Errors: {report['errors']}")
+    print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
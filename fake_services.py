@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the external services used by the bot.
+
+- FakeTelegramServer: Bot API subset (getMe, getUpdates, sendMessage, editMessageText, ...)
+- FakeOllamaServer: /api/generate (plain and streaming), /api/embeddings and /api/tags
+- FakeOpenRouterServer: /api/v1/chat/completions and /api/v1/voice-to-text
+
+All servers bind to 127.0.0.1 on an ephemeral port and keep simple call
+counters in ``stats`` so benchmark runs can report backend traffic.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {
+    "id": 1000000001,
+    "is_bot": True,
+    "first_name": "BenchBot",
+    "username": "bench_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+class FakeServer:
+    """Base class: runs an aiohttp app on a free local port"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.stats = Counter()
+        self.app = web.Application()
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "FakeServer":
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the ephemeral port picked by the OS
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _read_params(request: web.Request) -> dict:
+    """Bot API clients send either JSON or form data with JSON-encoded values"""
+    if request.content_type == "application/json":
+        return await request.json()
+    params = {}
+    for key, value in (await request.post()).items():
+        try:
+            params[key] = json.loads(value)
+        except (TypeError, ValueError):
+            params[key] = value
+    return params
+
+
+class FakeTelegramServer(FakeServer):
+    """Minimal Telegram Bot API with an injectable update queue"""
+
+    def __init__(self, token: str, api_latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.token = token
+        self.api_latency = api_latency
+        self.updates = []
+        self.enqueued_at = {}
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_update = asyncio.Event()
+        self.files = {}
+        self.app.router.add_route("*", "/bot{token}/{method}", self._dispatch)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self._download)
+
+    @property
+    def base_url(self) -> str:
+        """Value for ``ApplicationBuilder.base_url``"""
+        return f"{self.url}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        """Value for ``ApplicationBuilder.base_file_url``"""
+        return f"{self.url}/file/bot"
+
+    def push_command(self, command: str, args: str = "", chat_id: int = 1, user_id: int = 1,
+                     reply_voice_size: int = 0) -> int:
+        """Queue a private-chat command message, returns its update_id
+
+        With ``reply_voice_size`` the command replies to a voice message of that many bytes.
+        """
+        update_id = next(self._update_ids)
+        text = f"/{command} {args}".strip()
+        chat = {"id": chat_id, "type": "private", "first_name": f"user{user_id}"}
+        sender = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": sender,
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command) + 1}],
+        }
+        if reply_voice_size:
+            file_id = f"voice{update_id}"
+            self.files[file_id] = reply_voice_size
+            message["reply_to_message"] = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": chat,
+                "from": sender,
+                "voice": {"file_id": file_id, "file_unique_id": file_id, "duration": 5,
+                          "mime_type": "audio/ogg", "file_size": reply_voice_size},
+            }
+        self.updates.append({"update_id": update_id, "message": message})
+        self.enqueued_at[update_id] = time.perf_counter()
+        self._new_update.set()
+        return update_id
+
+    def _message(self, params: dict) -> dict:
+        return {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": str(params.get("text", "")),
+        }
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        # Confirmed updates are dropped, like the real API does
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self.updates[:limit]
+
+    async def _download(self, request: web.Request) -> web.StreamResponse:
+        """Stream a fake file of the registered size in 64 KiB chunks"""
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].split(".")[0]
+        size = self.files.get(file_id)
+        if size is None:
+            return web.Response(status=404)
+        self.stats["download"] += 1
+        response = web.StreamResponse(headers={"Content-Length": str(size)})
+        await response.prepare(request)
+        chunk = b"\0" * 65536
+        remaining = size
+        while remaining > 0:
+            await response.write(chunk[:remaining])
+            remaining -= len(chunk)
+        await response.write_eof()
+        return response
+
+    async def _dispatch(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.match_info["token"] != self.token:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"},
+                                     status=401)
+        params = await _read_params(request)
+        self.stats[method] += 1
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getFile":
+            file_id = params.get("file_id")
+            result = {"file_id": file_id, "file_unique_id": file_id,
+                      "file_size": self.files.get(file_id, 0), "file_path": f"voice/{file_id}.oga"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(params)
+        elif method in ("setMyCommands", "deleteWebhook", "sendChatAction"):
+            result = True
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeOllamaServer(FakeServer):
+    """Ollama stand-in with configurable load and per-token latency"""
+
+    def __init__(self, tokens: int = 40, token_latency: float = 0.005, load_latency: float = 0.0,
+                 embed_latency: float = 0.002, embed_dim: int = 64, error_rate: float = 0.0,
+                 stall: float = 0.0, **kwargs):
+        """``load_latency`` is paid only when a model is cold (not loaded or its keep_alive expired)
+
+        ``error_rate`` makes that share of requests fail with HTTP 500 after ``stall`` seconds,
+        to simulate a broken or hanging server.
+        """
+        super().__init__(**kwargs)
+        self.tokens = tokens
+        self.token_latency = token_latency
+        self.load_latency = load_latency
+        self.embed_latency = embed_latency
+        self.embed_dim = embed_dim
+        self.error_rate = error_rate
+        self.stall = stall
+        self._rng = random.Random(0)
+        self.loaded = {}                  # model -> expiry (monotonic)
+        self._loading = {}
+        self.app.router.add_get("/api/tags", self._tags)
+        self.app.router.add_post("/api/generate", self._generate)
+        self.app.router.add_post("/api/embeddings", self._embeddings)
+        self.app.router.add_get("/api/ps", self._ps)
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        self.stats["tags"] += 1
+        return web.json_response({"models": [{"name": "llama3.1:8b"}, {"name": "nomic-embed-text:latest"}]})
+
+    async def _ps(self, request: web.Request) -> web.Response:
+        now = time.monotonic()
+        return web.json_response({"models": [{"name": m} for m, exp in self.loaded.items() if exp > now]})
+
+    @staticmethod
+    def _keep_alive_seconds(value) -> float:
+        if value is None:
+            return 300.0
+        if isinstance(value, (int, float)):
+            return float("inf") if value < 0 else float(value)
+        units = {"s": 1, "m": 60, "h": 3600}
+        if value[-1:] in units:
+            return float(value[:-1]) * units[value[-1]]
+        return float(value)
+
+    async def _load(self, model: str, keep_alive) -> None:
+        """Simulate cold loads; concurrent requests for a loading model share one load"""
+        if self.loaded.get(model, 0) <= time.monotonic():
+            if model not in self._loading:
+                self.stats["cold_loads"] += 1
+                self._loading[model] = asyncio.ensure_future(asyncio.sleep(self.load_latency))
+            try:
+                await asyncio.shield(self._loading[model])
+            finally:
+                self._loading.pop(model, None)
+        self.loaded[model] = time.monotonic() + self._keep_alive_seconds(keep_alive)
+
+    async def _maybe_fail(self) -> bool:
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            await asyncio.sleep(self.stall)
+            return True
+        return False
+
+    def _unload(self, model: str) -> None:
+        self.stats["unload"] += 1
+        self.loaded.pop(model, None)
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        """Hashed bag-of-words vector: prompts sharing words get similar embeddings"""
+        payload = await request.json()
+        self.stats["embeddings"] += 1
+        if await self._maybe_fail():
+            return web.json_response({"error": "injected failure"}, status=500)
+        model = payload.get("model", "nomic-embed-text")
+        keep_alive = payload.get("keep_alive")
+        if keep_alive in (0, "0", "0s", "0m"):
+            self._unload(model)
+            return web.json_response({"embedding": []})
+        await self._load(model, keep_alive)
+        if not payload.get("prompt"):
+            # Empty prompt only loads the model
+            self.stats["load_only"] += 1
+            return web.json_response({"embedding": []})
+        await asyncio.sleep(self.embed_latency)
+        vector = [0.0] * self.embed_dim
+        for word in str(payload.get("prompt", "")).lower().split():
+            digest = hashlib.md5(word.strip("?!.,").encode()).digest()
+            vector[digest[0] % self.embed_dim] += 1.0 if digest[1] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return web.json_response({"embedding": [v / norm for v in vector]})
+
+    async def _generate(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.stats["generate"] += 1
+        if await self._maybe_fail():
+            return web.json_response({"error": "injected failure"}, status=500)
+        model = payload.get("model", "llama3.1:8b")
+        keep_alive = payload.get("keep_alive")
+        if keep_alive in (0, "0", "0s", "0m"):
+            self._unload(model)
+            return web.json_response({"model": model, "response": "", "done": True, "done_reason": "unload"})
+        await self._load(model, keep_alive)
+        if not payload.get("prompt"):
+            # Empty prompt only loads the model
+            self.stats["load_only"] += 1
+            return web.json_response({"model": model, "response": "", "done": True})
+
+        if not payload.get("stream", True):
+            await asyncio.sleep(self.tokens * self.token_latency)
+            return web.json_response({
+                "model": model,
+                "response": " ".join(f"tok{i}" for i in range(self.tokens)),
+                "done": True,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for i in range(self.tokens):
+            await asyncio.sleep(self.token_latency)
+            chunk = {"model": model, "response": f"tok{i} ", "done": False}
+            await response.write((json.dumps(chunk) + "\n").encode())
+        await response.write((json.dumps({"model": model, "response": "", "done": True}) + "\n").encode())
+        await response.write_eof()
+        return response
+
+
+class FakeOpenRouterServer(FakeServer):
+    """OpenRouter chat completions stand-in"""
+
+    def __init__(self, latency: float = 0.05, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.app.router.add_post("/api/v1/chat/completions", self._completions)
+        self.app.router.add_post("/api/v1/voice-to-text", self._voice_to_text)
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}/api/v1"
+
+    async def _completions(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.stats["chat_completions"] += 1
+        await asyncio.sleep(self.latency)
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        return web.json_response({
+            "id": f"fake-{self.stats['chat_completions']}",
+            "model": payload.get("model", "mistralai/mistral-7b-instruct"),
+            "choices": [{"index": 0, "message": {"role": "assistant",
+                                                  "content": f"Echo: {prompt[:200]}"}}],
+        })
+
+    async def _voice_to_text(self, request: web.Request) -> web.Response:
+        """Consume a multipart upload chunk by chunk and report its size"""
+        self.stats["voice_to_text"] += 1
+        reader = await request.multipart()
+        received = 0
+        async for part in reader:
+            while chunk := await part.read_chunk(65536):
+                received += len(chunk)
+        await asyncio.sleep(self.latency)
+        return web.json_response({"text": f"transcribed {received} bytes"})
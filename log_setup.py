@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Non-blocking structured logging.
+
+Log calls on the event loop only filter the record and put it on a bounded
+queue; a QueueListener thread formats it (JSON by default) and does the
+console/file I/O. Records carry the update_id/chat_id of the update being
+handled. Per-level sampling (LOG_SAMPLE_RATES) and a per-call-site rate limit
+(LOG_RATE_LIMIT records per LOG_RATE_WINDOW seconds, below ERROR) keep noisy
+messages cheap. Use %-style arguments so dropped records are never formatted.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "DEBUG=1.0,INFO=1.0")
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", "10"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# (update_id, chat_id) of the update being handled, set by tracing.traced
+update_context = contextvars.ContextVar("update_context", default=(None, None))
+
+_listeners = []
+_configured = False
+
+
+def bind_update(update_id: Optional[int], chat_id: Optional[int]) -> contextvars.Token:
+    return update_context.set((update_id, chat_id))
+
+
+def _parse_rates(spec: str) -> dict:
+    rates = {}
+    for item in spec.split(","):
+        name, sep, value = item.strip().partition("=")
+        level = logging.getLevelName(name.strip().upper())
+        if sep and isinstance(level, int):
+            rates[level] = float(value)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; dict messages are merged into the object"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        if isinstance(record.msg, dict):
+            entry.update(record.msg)
+        else:
+            entry["msg"] = record.getMessage()
+        for field in ("update_id", "chat_id", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class HotPathFilter(logging.Filter):
+    """Runs on the caller's thread before enqueueing: sampling, rate limiting, update context"""
+
+    def __init__(self, sample_rates: Optional[dict] = None, rate_limit: int = LOG_RATE_LIMIT,
+                 window: float = LOG_RATE_WINDOW):
+        super().__init__()
+        self.sample_rates = sample_rates if sample_rates is not None else _parse_rates(LOG_SAMPLE_RATES)
+        self.rate_limit = rate_limit
+        self.window = window
+        self._windows = {}              # call site -> [window start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            rate = self.sample_rates.get(record.levelno, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+
+        # Errors are never rate limited: a burst of exceptions is exactly what must be seen
+        if self.rate_limit and record.levelno < logging.ERROR:
+            key = (record.pathname, record.lineno)
+            now = record.created
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            elif state[1] >= self.rate_limit:
+                state[2] += 1
+                return False
+            else:
+                state[1] += 1
+
+        record.update_id, record.chat_id = update_context.get()
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process: only merge args so later mutation can't change the message;
+        # formatting happens in the listener thread
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def add_background_handler(logger: logging.Logger, *handlers: logging.Handler,
+                           log_filter: Optional[logging.Filter] = None) -> BoundedQueueHandler:
+    """Attach ``handlers`` to ``logger`` behind a queue so their I/O runs on a listener thread"""
+    queue_handler = BoundedQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    if log_filter is not None:
+        queue_handler.addFilter(log_filter)
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    logger.addHandler(queue_handler)
+    return queue_handler
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, log_file: str = LOG_FILE) -> None:
+    """Replace root handlers with a queued console (and optional rotating file) handler"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5,
+                                            encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+    add_background_handler(root, *handlers, log_filter=HotPathFilter())
+
+
+@atexit.register
+def shutdown_logging() -> None:
+    """Flush queued records; registered with atexit"""
+    while _listeners:
+        _listeners.pop().stop()
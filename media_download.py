@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Bounded-memory media downloads.
+
+Telegram files are streamed in fixed-size chunks into a SpooledTemporaryFile
+that moves to disk once it grows past SPOOL_THRESHOLD. Every download reserves
+the RAM it can hold (spool threshold + one chunk) from a global ByteBudget
+before it starts, so concurrent media messages wait for room instead of
+piling up in memory. The spool can be handed to aiohttp.FormData as-is for a
+streamed multipart upload; download_to_tempfile writes straight to disk for
+tools that need a real path.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from tracing import span
+
+CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(64 * 1024)))
+MAX_FILE_BYTES = int(os.getenv("MEDIA_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+SPOOL_THRESHOLD = int(os.getenv("MEDIA_SPOOL_THRESHOLD", str(1024 * 1024)))
+IN_FLIGHT_BUDGET = int(os.getenv("MEDIA_IN_FLIGHT_BUDGET", str(16 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+
+class FileTooLarge(Exception):
+    """Raised when a file exceeds the per-file byte limit"""
+
+
+class DownloadError(Exception):
+    """Raised when Telegram refuses a file download (message is safe to show users)"""
+
+
+class ByteBudget:
+    """Async counting semaphore measured in bytes"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, amount: int) -> int:
+        # A single request larger than the whole budget gets the whole budget
+        amount = min(amount, self.limit)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use + amount <= self.limit)
+            self.in_use += amount
+            self.peak = max(self.peak, self.in_use)
+        return amount
+
+    async def release(self, amount: int) -> None:
+        async with self._condition:
+            self.in_use -= amount
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def reserve(self, amount: int):
+        granted = await self.acquire(amount)
+        try:
+            yield granted
+        finally:
+            await self.release(granted)
+
+
+memory_budget = ByteBudget(IN_FLIGHT_BUDGET)
+
+
+async def _stream_into(tg_file, fileobj, max_bytes: int, timeout: float) -> int:
+    """Copy a telegram.File into ``fileobj`` chunk by chunk, returns the byte count"""
+    received = 0
+    with span("telegram.download", file_size=tg_file.file_size):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(tg_file.file_path,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    # Not raise_for_status(): its message includes the file URL, which contains the bot token
+                    raise DownloadError(f"Telegram file download failed (HTTP {response.status})")
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise FileTooLarge(f"Download exceeded {max_bytes} byte limit")
+                    fileobj.write(chunk)
+    logger.debug("Downloaded %d bytes from Telegram", received)
+    return received
+
+
+def check_size(media, max_bytes: int = MAX_FILE_BYTES) -> None:
+    """Raise FileTooLarge for a telegram.File or message attachment over the limit
+
+    Call it on the attachment before ``get_file()``: Telegram's getFile itself
+    fails with "file is too big" above 20 MB.
+    """
+    if media.file_size and media.file_size > max_bytes:
+        raise FileTooLarge(f"{media.file_size} bytes > {max_bytes} byte limit")
+
+
+@asynccontextmanager
+async def download_to_spool(tg_file, max_bytes: int = MAX_FILE_BYTES,
+                            spool_threshold: int = SPOOL_THRESHOLD, budget: ByteBudget = memory_budget,
+                            timeout: float = 120):
+    """Stream a telegram.File into a rewound spool file, closed on exit"""
+    check_size(tg_file, max_bytes)
+    expected = tg_file.file_size or spool_threshold
+    async with budget.reserve(min(expected, spool_threshold) + CHUNK_SIZE):
+        spool = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+        try:
+            await _stream_into(tg_file, spool, max_bytes, timeout)
+            spool.seek(0)
+            yield spool
+        finally:
+            spool.close()
+
+
+@asynccontextmanager
+async def download_to_tempfile(tg_file, suffix: str = "", max_bytes: int = MAX_FILE_BYTES,
+                               budget: ByteBudget = memory_budget, timeout: float = 120):
+    """Stream a telegram.File straight to disk for tools that need a path (ffmpeg), yields the path
+
+    The file lives in a private temp directory that is removed on exit, so callers
+    can write their outputs next to it.
+    """
+    check_size(tg_file, max_bytes)
+    with tempfile.TemporaryDirectory(prefix="bot_media_") as workdir:
+        path = os.path.join(workdir, f"input{suffix}")
+        async with budget.reserve(CHUNK_SIZE):
+            with open(path, "wb") as f:
+                await _stream_into(tg_file, f, max_bytes, timeout)
+        yield path
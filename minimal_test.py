@@ -4,10 +4,11 @@ Minimal bot test to identify the issue
 """
 
 import sys
-import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from log_setup import setup_logging
+
+# Set up queued logging
+setup_logging()
 
 print("🔍 Starting minimal bot test...")
 
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Ollama model lifecycle management.
+
+- preloads the configured models at startup so the first /llama doesn't pay the load cost
+- picks ``keep_alive`` per model from its recent traffic
+- pings hot models in the background during active hours to keep them resident
+- maps commands to models and keeps resident models within OLLAMA_RAM_BUDGET_GB,
+  unloading the least recently used model when a new one would not fit
+- treats embedding models (the semantic cache's) the same way, through /api/embeddings
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Optional
+
+import aiohttp
+
+from resilience import call, check_status, client_timeout
+from tracing import span
+
+
+def _parse_mapping(spec: str, cast=str) -> dict:
+    """Parse 'a=1,b=2' into {'a': cast('1'), 'b': cast('2')}"""
+    mapping = {}
+    for item in spec.split(","):
+        key, sep, value = item.strip().partition("=")
+        if sep and key and value:
+            mapping[key.strip()] = cast(value.strip())
+    return mapping
+
+
+OLLAMA_COMMAND_MODELS = _parse_mapping(os.getenv("OLLAMA_COMMAND_MODELS", "llama=llama3.1:8b"))
+OLLAMA_PRELOAD_MODELS = [m.strip() for m in os.getenv("OLLAMA_PRELOAD_MODELS", "").split(",") if m.strip()]
+OLLAMA_MODEL_RAM_GB = _parse_mapping(os.getenv("OLLAMA_MODEL_RAM_GB", "llama3.1:8b=5.5,nomic-embed-text=0.5"),
+                                    float)
+OLLAMA_DEFAULT_MODEL_RAM_GB = float(os.getenv("OLLAMA_DEFAULT_MODEL_RAM_GB", "5"))
+OLLAMA_RAM_BUDGET_GB = float(os.getenv("OLLAMA_RAM_BUDGET_GB", "8"))
+OLLAMA_ACTIVE_HOURS = os.getenv("OLLAMA_ACTIVE_HOURS", "8-23")
+OLLAMA_PING_INTERVAL = float(os.getenv("OLLAMA_PING_INTERVAL", "240"))
+
+# (requests in the last hour, keep_alive): busier models stay loaded longer
+KEEP_ALIVE_TIERS = [(10, 3600), (1, 1200), (0, 300)]
+# Outside active hours nothing is kept longer than Ollama's default
+IDLE_KEEP_ALIVE = 300
+
+logger = logging.getLogger(__name__)
+
+
+class ModelManager:
+    """Keeps the models the bot needs warm without exceeding the RAM budget"""
+
+    def __init__(self, base_url: Callable[[], str], command_models: Optional[dict] = None,
+                 preload_models: Optional[list] = None, ram_budget_gb: float = OLLAMA_RAM_BUDGET_GB,
+                 model_ram_gb: Optional[dict] = None, active_hours: str = OLLAMA_ACTIVE_HOURS,
+                 ping_interval: float = OLLAMA_PING_INTERVAL, embed_models: Optional[list] = None):
+        self.base_url = base_url
+        self.command_models = dict(command_models if command_models is not None else OLLAMA_COMMAND_MODELS)
+        self.embed_models = list(embed_models or [])
+        self.preload_models = list(preload_models or OLLAMA_PRELOAD_MODELS)
+        self.ram_budget_gb = ram_budget_gb
+        self.model_ram_gb = dict(model_ram_gb if model_ram_gb is not None else OLLAMA_MODEL_RAM_GB)
+        start, _, end = active_hours.partition("-")
+        self.active_hours = (int(start or 0), int(end or 24))
+        self.ping_interval = ping_interval
+        self._uses = {}                         # model -> deque of use timestamps
+        self._resident = OrderedDict()          # model -> expiry (monotonic), LRU order
+        self._lock = asyncio.Lock()
+        self._ping_task = None
+
+    # region Configuration
+    def model_for(self, command: str) -> str:
+        return self.command_models.get(command) or next(iter(self.command_models.values()), "llama3.1:8b")
+
+    def ram_for(self, model: str) -> float:
+        return self.model_ram_gb.get(model, OLLAMA_DEFAULT_MODEL_RAM_GB)
+
+    async def available_models(self) -> list:
+        """Names of the models pulled into Ollama (/api/tags)"""
+
+        async def request() -> dict:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{self.base_url()}/api/tags",
+                                       timeout=client_timeout("ollama", read=10)) as response:
+                    check_status("ollama", response.status)
+                    return await response.json() if response.status == 200 else {}
+
+        data = await call("ollama", request, idempotent=True)
+        return [entry.get("name") for entry in data.get("models", [])]
+
+    async def set_model(self, command: str, model: str) -> None:
+        """Route a command to another model
+
+        Raises ValueError for unknown commands, models Ollama doesn't have, or models
+        that can never fit the budget.
+        """
+        if command not in self.command_models:
+            raise ValueError(f"Unknown command /{command} "
+                             f"(use {', '.join('/' + name for name in sorted(self.command_models))})")
+        if self.ram_for(model) > self.ram_budget_gb:
+            raise ValueError(f"{model} needs {self.ram_for(model):.1f} GB, "
+                             f"budget is {self.ram_budget_gb:.1f} GB")
+        try:
+            installed = await self.available_models()
+        except Exception as e:
+            raise ValueError(f"Could not list Ollama models: {e}") from e
+        # Ollama resolves untagged names to :latest
+        if model not in installed and f"{model}:latest" not in installed:
+            raise ValueError(f"{model} is not available in Ollama (run: ollama pull {model})")
+        self.command_models[command] = model
+
+    def in_active_hours(self, now: Optional[datetime] = None) -> bool:
+        hour = (now or datetime.now()).hour
+        start, end = self.active_hours
+        return start <= hour < end if start <= end else hour >= start or hour < end
+    # endregion
+
+    # region Traffic & keep_alive
+    def record_use(self, model: str) -> None:
+        uses = self._uses.setdefault(model, deque())
+        now = time.monotonic()
+        uses.append(now)
+        while uses and now - uses[0] > 3600:
+            uses.popleft()
+
+    def recent_uses(self, model: str) -> int:
+        uses = self._uses.get(model, ())
+        now = time.monotonic()
+        return sum(1 for t in uses if now - t <= 3600)
+
+    def keep_alive_seconds(self, model: str) -> int:
+        if not self.in_active_hours():
+            return IDLE_KEEP_ALIVE
+        recent = self.recent_uses(model)
+        for min_uses, seconds in KEEP_ALIVE_TIERS:
+            if recent >= min_uses:
+                return seconds
+        return IDLE_KEEP_ALIVE
+
+    def keep_alive_for(self, model: str) -> str:
+        """``keep_alive`` value for an Ollama request"""
+        return f"{self.keep_alive_seconds(model) // 60}m"
+
+    async def use(self, model: str) -> str:
+        """Record a request for ``model``, make room for it and return its ``keep_alive``"""
+        self.record_use(model)
+        await self.ensure_resident(model)
+        return self.keep_alive_for(model)
+    # endregion
+
+    # region Residency
+    def _prune_resident(self) -> None:
+        now = time.monotonic()
+        for model in [m for m, expiry in self._resident.items() if expiry <= now]:
+            del self._resident[model]
+
+    def resident_models(self) -> list:
+        self._prune_resident()
+        return list(self._resident)
+
+    def _mark_resident(self, model: str) -> None:
+        self._resident[model] = time.monotonic() + self.keep_alive_seconds(model)
+        self._resident.move_to_end(model)
+
+    async def _request(self, model: str, keep_alive, timeout: float) -> bool:
+        """Empty-prompt request: loads (or with keep_alive=0 unloads) a model without running it"""
+        payload = {"model": model, "prompt": "", "keep_alive": keep_alive}
+        if model in self.embed_models:
+            endpoint = "embeddings"
+        else:
+            endpoint = "generate"
+            payload["stream"] = False
+
+        async def request() -> bool:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{self.base_url()}/api/{endpoint}", json=payload,
+                                        timeout=client_timeout("ollama", read=timeout)) as response:
+                    check_status("ollama", response.status)
+                    return response.status == 200
+
+        try:
+            return await call("ollama", request, idempotent=True)
+        except Exception as e:
+            logger.warning("⚠️ Ollama keep-alive request for %s failed: %s", model, e)
+            return False
+
+    async def ensure_resident(self, model: str) -> None:
+        """Make room for ``model`` in the RAM budget by unloading least recently used models"""
+        async with self._lock:
+            self._prune_resident()
+            if model in self._resident:
+                self._mark_resident(model)
+                return
+            needed = self.ram_for(model)
+            while self._resident and sum(map(self.ram_for, self._resident)) + needed > self.ram_budget_gb:
+                victim, _ = self._resident.popitem(last=False)
+                logger.info("📤 Unloading %s to fit %s in %.1f GB", victim, model, self.ram_budget_gb)
+                with span("ollama.unload", model=victim):
+                    await self._request(victim, 0, timeout=10)
+            self._mark_resident(model)
+
+    async def preload(self, models: Optional[list] = None) -> None:
+        """Load models (configured preload list, or every command model, plus embedding models)"""
+        if not models:
+            models = self.preload_models or list(self.command_models.values())
+            models = list(dict.fromkeys(models + self.embed_models))
+        for model in models:
+            await self.ensure_resident(model)
+            started = time.perf_counter()
+            if await self._request(model, self.keep_alive_for(model), timeout=300):
+                logger.info("🔥 Preloaded %s in %.1fs", model, time.perf_counter() - started)
+            else:
+                self._resident.pop(model, None)
+    # endregion
+
+    # region Background pings
+    def start(self) -> None:
+        """Preload and start the keep-warm loop (call from inside the event loop)"""
+        if self._ping_task is None:
+            self._ping_task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._ping_task:
+            self._ping_task.cancel()
+            try:
+                await self._ping_task
+            except asyncio.CancelledError:
+                pass
+            self._ping_task = None
+
+    async def _run(self) -> None:
+        await self.preload()
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if not self.in_active_hours():
+                continue
+            for model in self.resident_models():
+                # Only ping models with traffic; idle ones are allowed to expire.
+                # Models used since the last ping already had their keep_alive refreshed.
+                uses = self._uses.get(model)
+                if uses and time.monotonic() - uses[-1] < self.ping_interval:
+                    continue
+                if self.recent_uses(model) or model in self.preload_models:
+                    with span("ollama.ping", model=model):
+                        pinged = await self._request(model, self.keep_alive_for(model), timeout=300)
+                    if pinged:
+                        self._mark_resident(model)
+    # endregion
+
+    def status(self) -> str:
+        lines = [f"🧠 RAM budget: {self.ram_budget_gb:.1f} GB "
+                 f"(active hours {self.active_hours[0]}-{self.active_hours[1]})", "", "Commands:"]
+        for command, model in sorted(self.command_models.items()):
+            lines.append(f"/{command} → {model} ({self.ram_for(model):.1f} GB)")
+        for model in self.embed_models:
+            lines.append(f"embeddings → {model} ({self.ram_for(model):.1f} GB)")
+        lines += ["", "Resident:"]
+        for model in self.resident_models():
+            lines.append(f"{model}: {self.recent_uses(model)} req/h, keep_alive {self.keep_alive_for(model)}")
+        if not self._resident:
+            lines.append("(none)")
+        return "\n".join(lines)
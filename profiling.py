@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Event-loop diagnostics.
+
+- LoopBlockDetector: a watchdog thread that notices when the asyncio loop stops
+  ticking and logs the stack of the code that is blocking it
+- profile_cprofile / profile_sampling: profile the running bot for N seconds and
+  return the top hotspots as text (used by the owner-only /profile command)
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
+
+logger = logging.getLogger(__name__)
+_profile_lock = asyncio.Lock()
+
+
+class LoopBlockDetector:
+    """Reports code that blocks the event loop for longer than ``threshold`` seconds"""
+
+    def __init__(self, threshold: float = LOOP_BLOCK_THRESHOLD_MS / 1000, interval: float = 0.05,
+                 stack_depth: int = 12):
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_depth = stack_depth
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start watching the running loop (call from inside the loop)"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-block-detector", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            lag = time.monotonic() - beat - self.interval
+            if lag < self.threshold:
+                continue
+            # Keep growing max_lag while the stall lasts, not just when it is first seen
+            self.max_lag = max(self.max_lag, lag)
+            if beat == reported_beat:
+                continue
+            # Report each stall once, with the stack captured while it is still blocked
+            reported_beat = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)[-self.stack_depth:]) if frame else "<unknown>"
+            logger.warning("🧱 Event loop blocked for %.0fms+ by:\n%s", lag * 1000, stack)
+
+
+def _format_location(code_key) -> str:
+    filename, lineno, name = code_key
+    return f"{os.path.basename(filename)}:{lineno}({name})"
+
+
+async def profile_cprofile(seconds: float, top: int = 15) -> str:
+    """Run cProfile on the event loop thread for ``seconds`` and return the top functions"""
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+    # Drop the pstats preamble, keep the table
+    lines = out.getvalue().splitlines()
+    start = next((i for i, line in enumerate(lines) if "ncalls" in line), 0)
+    return "\n".join(line for line in lines[start:] if line.strip())
+
+
+async def profile_sampling(seconds: float, top: int = 15, interval: float = 0.005) -> str:
+    """Sample the event loop thread's stack every ``interval`` seconds and return hotspots"""
+    loop_thread_id = threading.get_ident()
+    own_counts = Counter()
+    total_counts = Counter()
+    samples = 0
+
+    def sampler(stop: threading.Event) -> None:
+        nonlocal samples
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                continue
+            samples += 1
+            own_counts[(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)] += 1
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if key not in seen:
+                    seen.add(key)
+                    total_counts[key] += 1
+                frame = frame.f_back
+
+    async with _profile_lock:
+        stop = threading.Event()
+        thread = threading.Thread(target=sampler, args=(stop,), name="sampling-profiler", daemon=True)
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(thread.join)
+
+    if not samples:
+        return "No samples collected"
+    lines = [f"{samples} samples every {interval * 1000:.0f}ms", "", "Self (line):"]
+    for key, count in own_counts.most_common(top):
+        lines.append(f"{count / samples:6.1%}  {_format_location(key)}")
+    lines += ["", "Total (function):"]
+    for key, count in total_counts.most_common(top):
+        lines.append(f"{count / samples:6.1%}  {_format_location(key)}")
+    return "\n".join(lines)
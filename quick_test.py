@@ -8,14 +8,11 @@ import logging
 from telegram import Update, BotCommand
 from telegram.ext import Application, CommandHandler, ContextTypes
 
-# Set up logging to console
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+from log_setup import setup_logging
+
+# Set up queued logging to console
+setup_logging()
+logger = logging.getLogger(__name__)
 
 TOKEN = "7563475603:AAH-bhTQky3DLzTAdA-V3MzzbU2p9zRx6eM"
 
@@ -33,7 +30,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 🤖 Owner: Chap Arian (@chapariannn)
 """
     await update.message.reply_text(welcome_msg)
-    print(f"📱 Responded to /start from {user.first_name} (@{user.username})")
+    logger.info("📱 Responded to /start from %s (@%s)", user.first_name, user.username)
 
 async def commands_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     commands_text = """🤖 **ENHANCED BOT COMMANDS**
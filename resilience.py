@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Resilience layer for external dependencies.
+
+Each dependency the bot calls (Ollama generation, Ollama embeddings, OpenRouter) gets:
+- a circuit breaker: after BREAKER_FAILURE_THRESHOLD consecutive failures calls
+  fail immediately with CircuitOpenError for BREAKER_RECOVERY_TIMEOUT seconds,
+  then a single half-open probe decides whether to close it again
+- separate connect and read timeouts (client_timeout)
+- bounded exponential backoff with full jitter for idempotent calls
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+import aiohttp
+
+from tracing import span
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+
+# Per-dependency timeouts in seconds; read is the longest gap allowed between received bytes.
+# Only dependencies with real call sites belong here: /status reports a circuit for each entry.
+DEPENDENCIES = {
+    "ollama": {"connect": 2.0, "read": 30.0},
+    # Optional semantic-cache lookups: own breaker so they can never trip generation
+    "ollama_embed": {"connect": 1.0, "read": 5.0},
+    "openrouter": {"connect": 5.0, "read": 60.0},
+}
+
+# Exceptions that mean the dependency (not the request) is unhealthy
+TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError, asyncio.TimeoutError,
+                    ConnectionError, TimeoutError)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is temporarily unavailable (retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DependencyError(Exception):
+    """A dependency answered, but with a server-side error (5xx / 429)"""
+
+
+def check_status(name: str, status: int) -> None:
+    """Raise DependencyError for responses that should count against the breaker"""
+    if status >= 500 or status == 429:
+        raise DependencyError(f"{name} returned HTTP {status}")
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open probe -> closed"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls would be rejected (open, or half-open with a probe already running)"""
+        state = self.state
+        return state == self.OPEN or (state == self.HALF_OPEN and self._probe_in_flight)
+
+    def retry_after(self) -> float:
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpenError; returns True if the call is the half-open probe"""
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            logger.info("🔌 %s: half-open, probing", self.name)
+            return True
+        raise CircuitOpenError(self.name, self.retry_after() or self.recovery_timeout)
+
+    def record_success(self, probe: bool = False) -> None:
+        if probe:
+            self._probe_in_flight = False
+        if self._state != self.CLOSED:
+            logger.info("✅ %s: circuit closed", self.name)
+        self._state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self, probe: bool = False) -> None:
+        if probe:
+            self._probe_in_flight = False
+        self.failures += 1
+        if probe or self.failures >= self.failure_threshold:
+            if self._state != self.OPEN or probe:
+                logger.warning("🚧 %s: circuit open for %.0fs after %d failures",
+                               self.name, self.recovery_timeout, self.failures)
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self, probe: bool) -> None:
+        """Give the probe slot back when a call ends without a verdict (e.g. cancelled)"""
+        if probe:
+            self._probe_in_flight = False
+
+
+breakers = {name: CircuitBreaker(name) for name in DEPENDENCIES}
+
+
+def client_timeout(name: str, read: Optional[float] = None, total: Optional[float] = None) -> aiohttp.ClientTimeout:
+    """aiohttp timeout with the dependency's connect/read limits (``read`` overrides the default)"""
+    config = DEPENDENCIES[name]
+    return aiohttp.ClientTimeout(total=total, connect=config["connect"], sock_connect=config["connect"],
+                                 sock_read=read if read is not None else config["read"])
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def call(name: str, func, *args, idempotent: bool = False, attempts: int = RETRY_ATTEMPTS, **kwargs):
+    """Await ``func(*args, **kwargs)`` through the dependency's breaker
+
+    Idempotent calls are retried on transient errors with jittered backoff; an open
+    circuit raises CircuitOpenError immediately and is never retried. A logical call
+    counts as a single success or failure however many attempts it took.
+    """
+    breaker = breakers[name]
+    attempts = attempts if idempotent else 1
+    probe = breaker.before_call()
+    try:
+        for attempt in range(attempts):
+            try:
+                result = await func(*args, **kwargs)
+            except (DependencyError, *TRANSIENT_ERRORS) as e:
+                if attempt + 1 >= attempts:
+                    breaker.record_failure(probe)
+                    probe = False
+                    raise
+                delay = _backoff(attempt)
+                logger.debug("%s call failed (%s), retrying in %.2fs", name, type(e).__name__, delay)
+                with span("retry.backoff", dependency=name, attempt=attempt + 1):
+                    await asyncio.sleep(delay)
+            else:
+                breaker.record_success(probe)
+                probe = False
+                return result
+    finally:
+        # Request-level errors and cancellation say nothing about the dependency's health
+        breaker.release_probe(probe)
+
+
+def status_lines() -> list:
+    icons = {CircuitBreaker.CLOSED: "✅", CircuitBreaker.HALF_OPEN: "🟡", CircuitBreaker.OPEN: "🚧"}
+    return [f"{icons[b.state]} {name}: {b.state}" for name, b in breakers.items()]
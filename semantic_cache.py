@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Semantic answer cache for AI commands.
+
+Prompts are embedded with Ollama's embeddings endpoint and kept in a compact
+NumPy matrix. Lookups use random-hyperplane LSH (several tables, multi-probe)
+to pick candidates, then exact cosine similarity; if the best match passes
+the threshold its stored answer is served instead of generating a new one.
+When the cache is full the least recently used entry is evicted.
+"""
+
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional, Tuple
+
+import aiohttp
+import numpy as np
+
+from resilience import call, check_status, client_timeout
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "nomic-embed-text")
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# Whole budget for the embedding call; past it the lookup is skipped so the cache never costs more than it saves
+SEMANTIC_CACHE_TIMEOUT = float(os.getenv("SEMANTIC_CACHE_TIMEOUT", "1.0"))
+
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[str], Awaitable[Optional[np.ndarray]]]
+
+
+def ollama_embedder(base_url: Callable[[], str], model: str = SEMANTIC_CACHE_MODEL,
+                    timeout: float = SEMANTIC_CACHE_TIMEOUT,
+                    keep_alive: Optional[Callable[[str], Awaitable[str]]] = None) -> Embedder:
+    """Embedder backed by Ollama's /api/embeddings (base_url is read on every call)
+
+    ``keep_alive`` (e.g. ModelManager.use) is awaited before each request and its
+    value sent along, so the embedding model stays loaded between lookups.
+    """
+
+    async def request(text: str) -> Optional[dict]:
+        payload = {"model": model, "prompt": text}
+        if keep_alive is not None:
+            payload["keep_alive"] = await keep_alive(model)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{base_url()}/api/embeddings", json=payload,
+                                    timeout=client_timeout("ollama_embed", read=timeout,
+                                                           total=timeout)) as response:
+                check_status("ollama_embed", response.status)
+                return await response.json() if response.status == 200 else None
+
+    async def embed(text: str) -> Optional[np.ndarray]:
+        # Not retried: the cache is optional, and a miss is cheaper than waiting.
+        # Any failure (including an open circuit) just skips the cache.
+        try:
+            data = await call("ollama_embed", request, text)
+        except Exception as e:
+            logger.debug("Embedding failed: %s", e)
+            return None
+        vector = data.get("embedding") if data else None
+        return np.asarray(vector, dtype=np.float32) if vector else None
+
+    return embed
+
+
+def _normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+class SemanticCache:
+    """Near-duplicate prompt -> answer cache with LRU eviction"""
+
+    def __init__(self, embed: Embedder, capacity: int = SEMANTIC_CACHE_SIZE,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, num_tables: int = 4, num_bits: int = 10,
+                 brute_force_below: int = 1024, seed: int = 0):
+        self.embed = embed
+        self.capacity = capacity
+        self.threshold = threshold
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.brute_force_below = brute_force_below
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self._rng = np.random.default_rng(seed)
+        self._vectors = None              # (capacity, dim) float32, unit length
+        self._planes = None               # (num_tables, num_bits, dim)
+        self._bit_weights = 1 << np.arange(num_bits)
+        self._signatures = np.zeros((capacity, num_tables), dtype=np.int64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._answers = [None] * capacity
+        self._prompts = [None] * capacity
+        self._exact = {}
+        self._buckets = [defaultdict(set) for _ in range(num_tables)]
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _init_index(self, dim: int) -> None:
+        self._vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+        self._planes = self._rng.standard_normal((self.num_tables, self.num_bits, dim)).astype(np.float32)
+
+    def _signature(self, vector: np.ndarray) -> np.ndarray:
+        bits = (self._planes @ vector) > 0              # (num_tables, num_bits)
+        return bits @ self._bit_weights
+
+    def _candidates(self, signature: np.ndarray) -> np.ndarray:
+        """Slots sharing a bucket, or one bit away from it, in any table"""
+        slots = set()
+        for table, key in enumerate(signature.tolist()):
+            buckets = self._buckets[table]
+            slots |= buckets.get(key, set())
+            for bit in range(self.num_bits):
+                slots |= buckets.get(key ^ (1 << bit), set())
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+    async def lookup(self, prompt: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached answer or None, prompt embedding for a later ``add``)"""
+        slot = self._exact.get(_normalize_prompt(prompt))
+        if slot is not None:
+            self.hits += 1
+            self.exact_hits += 1
+            self._last_used[slot] = time.monotonic()
+            return self._answers[slot], None
+
+        vector = await self.embed(prompt)
+        if vector is None:
+            return None, None
+        norm = np.linalg.norm(vector)
+        if not norm or (self._vectors is not None and vector.shape[0] != self._vectors.shape[1]):
+            return None, None
+        vector = vector / norm
+
+        if self._size:
+            if self._size < self.brute_force_below:
+                slots = np.arange(self._size)
+            else:
+                slots = self._candidates(self._signature(vector))
+            if slots.size:
+                scores = self._vectors[slots] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = int(slots[best])
+                    self.hits += 1
+                    self._last_used[slot] = time.monotonic()
+                    logger.debug("Semantic cache hit (%.3f) for: %.60s", scores[best], prompt)
+                    return self._answers[slot], vector
+
+        self.misses += 1
+        return None, vector
+
+    def add(self, prompt: str, vector: Optional[np.ndarray], answer: str) -> None:
+        """Store an answer for a prompt embedded by ``lookup``"""
+        if vector is None:
+            return
+        key = _normalize_prompt(prompt)
+        if key in self._exact:
+            # Concurrent misses for the same prompt: keep one entry
+            self._answers[self._exact[key]] = answer
+            return
+        if self._vectors is None:
+            self._init_index(vector.shape[0])
+
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+            self._evict(slot)
+
+        signature = self._signature(vector)
+        self._vectors[slot] = vector
+        self._signatures[slot] = signature
+        self._last_used[slot] = time.monotonic()
+        self._answers[slot] = answer
+        self._prompts[slot] = key
+        self._exact[key] = slot
+        for table, bucket_key in enumerate(signature.tolist()):
+            self._buckets[table][bucket_key].add(slot)
+
+    def _evict(self, slot: int) -> None:
+        for table, key in enumerate(self._signatures[slot].tolist()):
+            bucket = self._buckets[table].get(key)
+            if bucket:
+                bucket.discard(slot)
+                if not bucket:
+                    del self._buckets[table][key]
+        if self._exact.get(self._prompts[slot]) == slot:
+            del self._exact[self._prompts[slot]]
+        self._answers[slot] = None
+        self._prompts[slot] = None
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Per-update tracing for bot handlers.
+
+Every handler wrapped with ``traced`` opens a root span carrying the update ID
+and command; backend calls inside it open child spans with ``span(...)``.
+Telegram API calls are traced automatically by ``TracingRequest``.
+Traces slower than TRACE_SLOW_MS are sampled (TRACE_SAMPLE_RATE) as JSON lines
+into a rotating log file (TRACE_LOG_FILE).
+"""
+
+import contextvars
+import functools
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+from telegram import Update
+from telegram.request import HTTPXRequest
+
+from log_setup import JsonFormatter, add_background_handler, bind_update, update_context
+
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "slow_traces.log")
+
+logger = logging.getLogger(__name__)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_trace_logger = None
+
+
+class Span:
+    """Timed operation with attributes and child spans"""
+
+    __slots__ = ("name", "attrs", "start", "end", "children", "error")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+        self.error = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self, origin: Optional[float] = None) -> dict:
+        origin = self.start if origin is None else origin
+        data = {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Open a child span of the current span (no-op outside a trace)"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, **attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def _get_trace_logger() -> logging.Logger:
+    global _trace_logger
+    if _trace_logger is None:
+        _trace_logger = logging.getLogger("bot.slow_traces")
+        _trace_logger.propagate = False
+        handler = RotatingFileHandler(TRACE_LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3,
+                                      encoding="utf-8")
+        handler.setFormatter(JsonFormatter())
+        # File writes and JSON encoding happen on the listener thread, not the event loop
+        add_background_handler(_trace_logger, handler)
+        _trace_logger.setLevel(logging.INFO)
+    return _trace_logger
+
+
+def record_trace(root: Span) -> None:
+    """Write a finished trace to the slow-trace log if it qualifies"""
+    duration = root.duration_ms
+    if duration < TRACE_SLOW_MS or random.random() >= TRACE_SAMPLE_RATE:
+        return
+    logger.warning("🐢 Slow update %s /%s: %.0fms", root.attrs.get("update_id"),
+                   root.attrs.get("command"), duration)
+    _get_trace_logger().info(root.to_dict())
+
+
+def _command_of(update: Update) -> str:
+    message = update.effective_message
+    text = (message.text or "") if message else ""
+    if text.startswith("/"):
+        return text.split()[0][1:].split("@")[0]
+    return "message"
+
+
+def traced(handler):
+    """Decorator for handlers: opens the root span for the update"""
+
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context, *args, **kwargs):
+        chat = update.effective_chat
+        root = Span("update", update_id=update.update_id, command=_command_of(update),
+                    chat_id=chat.id if chat else None)
+        token = _current_span.set(root)
+        update_token = bind_update(update.update_id, chat.id if chat else None)
+        try:
+            return await handler(update, context, *args, **kwargs)
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            root.end = time.perf_counter()
+            _current_span.reset(token)
+            update_context.reset(update_token)
+            record_trace(root)
+
+    return wrapper
+
+
+class TracingRequest(HTTPXRequest):
+    """HTTPXRequest that opens a ``telegram.<method>`` span for every Bot API call"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with span(f"telegram.{url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, method, *args, **kwargs)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Target-size video compression with a shared CPU budget.
+
+- probe(): ffprobe duration/bitrate/resolution, cached per file
+- plan_encode(): picks CRF (quality) or two-pass bitrate (target size) and a
+  resolution from RESOLUTION_LADDER that the bitrate can carry
+- CpuBudget: hands out ffmpeg threads (decoder, filters and encoder) from a
+  global pool so concurrent jobs share the host instead of each using every core
+- compress_video(): probe -> plan -> encode, with one corrective re-encode if the
+  output still overshoots the target
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from tracing import span
+
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+COMPRESS_CPU_THREADS = int(os.getenv("COMPRESS_CPU_THREADS", str(os.cpu_count() or 2)))
+# At most half the pool by default, so a job that arrives later still gets threads right away
+COMPRESS_MAX_THREADS_PER_JOB = int(os.getenv("COMPRESS_MAX_THREADS_PER_JOB",
+                                             str(max(1, COMPRESS_CPU_THREADS // 2))))
+COMPRESS_PRESET = os.getenv("COMPRESS_PRESET", "veryfast")
+
+# (short side, minimum video kbps that still looks acceptable at that size);
+# the short side is the height of landscape video and the width of portrait video
+RESOLUTION_LADDER = [(1080, 2500), (720, 1200), (480, 600), (360, 350), (240, 150), (144, 80)]
+
+QUALITY_CRF = {"high": 23, "medium": 28, "low": 32}
+QUALITY_MAX_SHORT_SIDE = {"high": 1080, "medium": 720, "low": 480}
+
+# Headroom for container overhead and encoder rate-control error
+SIZE_SAFETY = 0.92
+
+logger = logging.getLogger(__name__)
+
+
+class CompressionError(Exception):
+    """Raised when a video cannot be compressed as requested"""
+
+
+@dataclass
+class MediaInfo:
+    duration: float
+    bitrate_kbps: int
+    width: int
+    height: int
+    has_audio: bool
+    size: int
+
+    @property
+    def short_side(self) -> int:
+        return min(self.width, self.height) if self.width and self.height else self.height or self.width
+
+
+@dataclass
+class EncodePlan:
+    mode: str                       # "crf" or "2pass"
+    short_side: int
+    audio_kbps: int
+    crf: Optional[int] = None
+    video_kbps: Optional[int] = None
+
+
+class CpuBudget:
+    """Pool of encoder threads shared fairly by all running compression jobs"""
+
+    def __init__(self, total: int = COMPRESS_CPU_THREADS, per_job: int = COMPRESS_MAX_THREADS_PER_JOB):
+        self.total = max(1, total)
+        # A job's share is fixed when it starts: never hand one job the whole pool
+        self.per_job = max(1, min(per_job, self.total // 2))
+        self.free = self.total
+        self.waiting = 0
+        self.running = 0
+        self._condition = asyncio.Condition()
+
+    def _fair_share(self) -> int:
+        # Split the pool between running and queued jobs, never below one thread
+        return max(1, min(self.per_job, self.total // (self.running + self.waiting + 1)))
+
+    async def acquire(self) -> int:
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.free >= 1)
+            finally:
+                self.waiting -= 1
+            threads = min(self.free, self._fair_share())
+            self.free -= threads
+            self.running += 1
+            return threads
+
+    async def release(self, threads: int) -> None:
+        async with self._condition:
+            self.free += threads
+            self.running -= 1
+            self._condition.notify_all()
+
+
+cpu_budget = CpuBudget()
+_probe_cache = OrderedDict()
+_PROBE_CACHE_SIZE = 256
+
+
+async def _run(*cmd: str) -> str:
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # Don't leave an orphaned encoder burning CPU after the job is gone
+        if process.returncode is None:
+            process.kill()
+            await asyncio.shield(process.wait())
+        raise
+    if process.returncode != 0:
+        raise CompressionError(f"{cmd[0]} failed: {stderr.decode(errors='replace')[-300:]}")
+    return stdout.decode(errors="replace")
+
+
+async def probe(path: str, cache_key: Optional[str] = None) -> MediaInfo:
+    """ffprobe a file; results are cached by ``cache_key`` (e.g. Telegram file_unique_id)"""
+    key = cache_key or (path, os.path.getsize(path), os.path.getmtime(path))
+    if key in _probe_cache:
+        _probe_cache.move_to_end(key)
+        return _probe_cache[key]
+
+    with span("ffprobe"):
+        output = await _run("ffprobe", "-v", "error", "-print_format", "json",
+                            "-show_format", "-show_streams", path)
+    data = json.loads(output)
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise CompressionError("No video stream found")
+
+    duration = float(fmt.get("duration") or video.get("duration") or 0)
+    if duration <= 0:
+        raise CompressionError("Could not determine video duration")
+    size = int(fmt.get("size") or os.path.getsize(path))
+    info = MediaInfo(
+        duration=duration,
+        bitrate_kbps=int(int(fmt.get("bit_rate") or size * 8 / duration) / 1000),
+        width=int(video.get("width") or 0),
+        height=int(video.get("height") or 0),
+        has_audio=any(s.get("codec_type") == "audio" for s in streams),
+        size=size,
+    )
+    _probe_cache[key] = info
+    if len(_probe_cache) > _PROBE_CACHE_SIZE:
+        _probe_cache.popitem(last=False)
+    return info
+
+
+def _ladder_short_side(video_kbps: float, source_short_side: int, max_short_side: int = 1080) -> int:
+    """Largest ladder size the bitrate can carry, never upscaling"""
+    cap = min(source_short_side or max_short_side, max_short_side)
+    for short_side, min_kbps in RESOLUTION_LADDER:
+        if short_side <= cap and video_kbps >= min_kbps:
+            return short_side
+    return min(cap, RESOLUTION_LADDER[-1][0])
+
+
+def plan_encode(info: MediaInfo, target_bytes: Optional[int] = None, quality: Optional[str] = None) -> EncodePlan:
+    """Choose encoder settings for a target size (two-pass) or quality level (CRF)"""
+    if target_bytes:
+        total_kbps = target_bytes * 8 * SIZE_SAFETY / info.duration / 1000
+        audio_kbps = 0
+        if info.has_audio:
+            audio_kbps = 96 if total_kbps >= 800 else 64 if total_kbps >= 250 else 32
+        video_kbps = total_kbps - audio_kbps
+        if video_kbps < RESOLUTION_LADDER[-1][1]:
+            raise CompressionError(f"Target of {target_bytes / 1024 / 1024:.1f} MB is too small "
+                                   f"for a {info.duration:.0f}s video")
+        # Never ask for more than the source already uses
+        video_kbps = min(video_kbps, max(info.bitrate_kbps - audio_kbps, RESOLUTION_LADDER[-1][1]))
+        return EncodePlan(mode="2pass", short_side=_ladder_short_side(video_kbps, info.short_side),
+                          audio_kbps=audio_kbps, video_kbps=int(video_kbps))
+
+    quality = quality or "medium"
+    if quality not in QUALITY_CRF:
+        raise CompressionError(f"Unknown quality '{quality}' (use {', '.join(QUALITY_CRF)})")
+    max_short_side = QUALITY_MAX_SHORT_SIDE[quality]
+    return EncodePlan(mode="crf", short_side=min(info.short_side or max_short_side, max_short_side),
+                      crf=QUALITY_CRF[quality], audio_kbps=96 if info.has_audio else 0)
+
+
+def _encode_args(plan: EncodePlan, threads: int) -> list:
+    args = ["-c:v", "libx264", "-preset", COMPRESS_PRESET, "-threads", str(threads),
+            # Scale the short side to plan.short_side whatever the orientation (after autorotation)
+            "-vf", f"scale={plan.short_side}:{plan.short_side}:force_original_aspect_ratio=increase"
+                   f":force_divisible_by=2",
+            "-pix_fmt", "yuv420p"]
+    if plan.mode == "crf":
+        args += ["-crf", str(plan.crf)]
+    else:
+        args += ["-b:v", f"{plan.video_kbps}k", "-maxrate", f"{int(plan.video_kbps * 1.5)}k",
+                 "-bufsize", f"{plan.video_kbps * 2}k"]
+    return args
+
+
+async def _encode(src: str, dst: str, plan: EncodePlan) -> None:
+    threads = await cpu_budget.acquire()
+    try:
+        with span("ffmpeg.encode", mode=plan.mode, short_side=plan.short_side, threads=threads,
+                  video_kbps=plan.video_kbps, crf=plan.crf):
+            video_args = _encode_args(plan, threads)
+            audio_args = ["-c:a", "aac", "-b:a", f"{plan.audio_kbps}k"] if plan.audio_kbps else ["-an"]
+            # The budget covers the whole pipeline: decoder (-threads before -i), filters and encoder
+            base = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-filter_threads", str(threads),
+                    "-threads", str(threads), "-i", src]
+            if plan.mode == "2pass":
+                passlog = os.path.join(os.path.dirname(dst), "ffmpeg2pass")
+                await _run(*base, *video_args, "-pass", "1", "-passlogfile", passlog,
+                           "-an", "-f", "mp4", os.devnull)
+                await _run(*base, *video_args, "-pass", "2", "-passlogfile", passlog,
+                           *audio_args, "-movflags", "+faststart", dst)
+            else:
+                await _run(*base, *video_args, *audio_args, "-movflags", "+faststart", dst)
+    finally:
+        await cpu_budget.release(threads)
+
+
+async def compress_video(src: str, dst: str, target_bytes: Optional[int] = None,
+                         quality: Optional[str] = None, cache_key: Optional[str] = None,
+                         size_limit: int = TELEGRAM_UPLOAD_LIMIT) -> MediaInfo:
+    """Compress ``src`` into ``dst`` (mp4) and return the source MediaInfo
+
+    Target-size jobs use two-pass encoding; quality jobs use CRF and fall back to
+    a two-pass encode at ``size_limit`` if the result would not be uploadable.
+    """
+    info = await probe(src, cache_key)
+    target = min(target_bytes, size_limit) if target_bytes else None
+    plan = plan_encode(info, target_bytes=target, quality=quality)
+    logger.info("🎬 Compressing %.0fs %dx%d video: %s", info.duration, info.width, info.height, plan)
+    await _encode(src, dst, plan)
+
+    limit = target or size_limit
+    size = os.path.getsize(dst)
+    if size > limit:
+        # Rate control overshoot: re-encode once with the bitrate scaled down
+        fallback = plan_encode(info, target_bytes=limit)
+        if plan.mode == "2pass":
+            fallback.video_kbps = int(plan.video_kbps * limit / size * SIZE_SAFETY)
+        logger.warning("⚠️ Output %d bytes exceeds %d, re-encoding at %sk", size, limit, fallback.video_kbps)
+        await _encode(src, dst, fallback)
+        if os.path.getsize(dst) > limit:
+            raise CompressionError("Could not reach the requested size")
+    return info
@@ -5,6 +5,7 @@ Working Telegram Bot - Compatible with VS Code environment
 
 import asyncio
 import logging
+import math
 import os
 import sys
 from telegram import Update, BotCommand
@@ -13,17 +14,24 @@ import aiohttp
 import subprocess
 import tempfile
 import json
+from tracing import traced, span, TracingRequest
+from profiling import LoopBlockDetector, profile_cprofile, profile_sampling
+from semantic_cache import SemanticCache, ollama_embedder, SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_MODEL
+from media_download import check_size, download_to_spool, download_to_tempfile, DownloadError, FileTooLarge
+from video_compress import compress_video, CompressionError, QUALITY_CRF
+from model_manager import ModelManager
+from resilience import breakers, call, check_status, client_timeout, status_lines, CircuitOpenError
+from log_setup import setup_logging
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Configure logging (queued, structured JSON; see log_setup.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Bot configuration
-TOKEN = "7563475603:AAH-bhTQky3DLzTAdA-V3MzzbU2p9zRx6eM"
-LLAMA_API_URL = "http://127.0.0.1:11500"
+TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "7563475603:AAH-bhTQky3DLzTAdA-V3MzzbU2p9zRx6eM")
+LLAMA_API_URL = os.getenv("LLAMA_API_URL", "http://127.0.0.1:11500")
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1")
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
 # User Information
 BOT_OWNER = {
@@ -35,8 +43,26 @@ BOT_OWNER = {
     "chat_id": 7684262149
 }
 
-print(f"🤖 Enhanced Telegram Bot Starting...")
-print(f"👤 Owner: {BOT_OWNER['first_name']} {BOT_OWNER['last_name']} ({BOT_OWNER['username']})")
+# Watchdog for code that blocks the event loop (started in on_startup)
+loop_block_detector = LoopBlockDetector()
+
+# Preloads Ollama models, manages keep_alive and per-command model routing (started in on_startup)
+model_manager = ModelManager(lambda: LLAMA_API_URL,
+                             embed_models=[SEMANTIC_CACHE_MODEL] if SEMANTIC_CACHE_ENABLED else None)
+
+# Paraphrased /llama questions are answered from here instead of the model (one cache per model)
+llama_caches = {}
+
+def llama_cache_for(model: str):
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if model not in llama_caches:
+        llama_caches[model] = SemanticCache(ollama_embedder(lambda: LLAMA_API_URL,
+                                                                keep_alive=model_manager.use))
+    return llama_caches[model]
+
+logger.info("🤖 Enhanced Telegram Bot Starting...")
+logger.info("👤 Owner: %s %s (%s)", BOT_OWNER['first_name'], BOT_OWNER['last_name'], BOT_OWNER['username'])
 
 # Command handlers
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -52,7 +78,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 ✅ Bot is fully operational!
 """
     await update.message.reply_text(welcome_msg)
-    print(f"📱 /start command from {user.first_name} (@{user.username or 'no_username'})")
+    logger.info("📱 /start command from %s (@%s)", user.first_name, user.username or 'no_username')
 
 async def commands_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     commands_text = """🤖 **ENHANCED BOT COMMANDS**
@@ -63,6 +89,8 @@ async def commands_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 🎵 **MEDIA PROCESSING**  
 /ffmpeg_test - Test FFmpeg availability
+/voice_openrouter - Transcribe a voice message (reply to it)
+/compress_video [size_mb|high|medium|low] - Compress a video (reply to it)
 
 📱 **BASIC**
 /start - Initialize bot
@@ -78,7 +106,7 @@ async def commands_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 async def test_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text("✅ Bot is working perfectly! All systems operational.")
-    print(f"📱 /test command executed for user {update.effective_user.first_name}")
+    logger.info("📱 /test command executed for user %s", update.effective_user.first_name)
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     status_msg = """📊 **Bot Status Report**
@@ -89,10 +117,22 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 ⚙️ FFmpeg: Checking...
 🦙 Llama API: Checking...
 
+🔌 **Dependencies**
+{dependencies}
+
 🔢 Bot Version: Enhanced v2.0
 ⏰ Uptime: Active
 """
-    await update.message.reply_text(status_msg, parse_mode="Markdown")
+    dependencies = "\n".join(line.replace("_", " ") for line in status_lines())
+    await update.message.reply_text(status_msg.format(dependencies=dependencies), parse_mode="Markdown")
+
+async def send_llama_reply(update: Update, reply: str) -> None:
+    # Split long responses
+    if len(reply) > 4096:
+        for i in range(0, len(reply), 4096):
+            await update.message.reply_text(reply[i:i+4096])
+    else:
+        await update.message.reply_text(f"🦙 **Llama:** {reply}")
 
 async def llama_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
@@ -100,30 +140,53 @@ async def llama_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         return
 
     query = " ".join(context.args)
+    model = model_manager.model_for("llama")
+    llama_cache = llama_cache_for(model)
+    vector = None
+    if llama_cache is not None:
+        with span("semantic_cache.lookup") as lookup_span:
+            cached, vector = await llama_cache.lookup(query)
+            if lookup_span is not None:
+                lookup_span.attrs["hit"] = cached is not None
+        if cached is not None:
+            await send_llama_reply(update, cached)
+            return
+
+    # Fail fast while Ollama's circuit is open instead of waiting for timeouts
+    if breakers["ollama"].is_open:
+        await update.message.reply_text(f"🚧 Llama is temporarily unavailable. "
+                                        f"Try again in {breakers['ollama'].retry_after():.0f}s.")
+        return
+
     await update.message.reply_text("🤔 Thinking... (connecting to Llama)")
     
     try:
         payload = {
-            "model": "llama3.1:8b",
+            "model": model,
             "prompt": query,
-            "stream": False
+            "stream": False,
+            "keep_alive": await model_manager.use(model)
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{LLAMA_API_URL}/api/generate", 
-                              json=payload, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    reply = data.get("response", "⚠️ No response from Llama")
-                    
-                    # Split long responses
-                    if len(reply) > 4096:
-                        for i in range(0, len(reply), 4096):
-                            await update.message.reply_text(reply[i:i+4096])
-                    else:
-                        await update.message.reply_text(f"🦙 **Llama:** {reply}")
-                else:
-                    await update.message.reply_text("❌ Llama API unavailable. Make sure Ollama is running.")
+        async def generate():
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{LLAMA_API_URL}/api/generate",
+                                  json=payload, timeout=client_timeout("ollama")) as response:
+                    check_status("ollama", response.status)
+                    return await response.json() if response.status == 200 else None
+
+        with span("ollama.generate", model=payload["model"]):
+            data = await call("ollama", generate)
+
+        if data is not None:
+            reply = data.get("response")
+            if reply and llama_cache is not None:
+                llama_cache.add(query, vector, reply)
+            await send_llama_reply(update, reply or "⚠️ No response from Llama")
+        else:
+            await update.message.reply_text("❌ Llama API unavailable. Make sure Ollama is running.")
+    except CircuitOpenError as e:
+        await update.message.reply_text(f"🚧 {str(e)}")
     except asyncio.TimeoutError:
         await update.message.reply_text("⏱️ Llama response timeout. Try again.")
     except Exception as e:
@@ -131,7 +194,10 @@ async def llama_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
 async def ffmpeg_test(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
-        result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True)
+        # Run in a worker thread so the event loop keeps serving other updates
+        with span("ffmpeg.version"):
+            result = await asyncio.to_thread(subprocess.run, ["ffmpeg", "-version"],
+                                             capture_output=True, text=True)
         if result.returncode == 0:
             version_line = result.stdout.split('\n')[0]
             await update.message.reply_text(f"✅ FFmpeg available:\n`{version_line}`", parse_mode="Markdown")
@@ -142,24 +208,210 @@ async def ffmpeg_test(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     except Exception as e:
         await update.message.reply_text(f"❌ FFmpeg test error: {str(e)}")
 
+async def openrouter_voice_to_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Transcribe a voice/audio message with OpenRouter (reply to it with /voice_openrouter)"""
+    message = update.message.reply_to_message or update.message
+    media = message.voice or message.audio
+    if not media:
+        await update.message.reply_text("❌ Reply to a voice message with /voice_openrouter")
+        return
+    if not OPENROUTER_API_KEY:
+        await update.message.reply_text("❌ OpenRouter API key not configured")
+        return
+    if breakers["openrouter"].is_open:
+        await update.message.reply_text(f"🚧 Transcription is temporarily unavailable. "
+                                        f"Try again in {breakers['openrouter'].retry_after():.0f}s.")
+        return
+
+    try:
+        check_size(media)
+        voice_file = await media.get_file()
+        headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}"}
+
+        # Stream the file to a spool and upload it as multipart, never holding it all in memory
+        async with download_to_spool(voice_file) as spool:
+            form = aiohttp.FormData()
+            form.add_field("file", spool, filename="voice.ogg", content_type=media.mime_type or "audio/ogg")
+
+            async def transcribe():
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(f"{OPENROUTER_API_URL}/voice-to-text", headers=headers,
+                                            data=form, timeout=client_timeout("openrouter")) as response:
+                        check_status("openrouter", response.status)
+                        return await response.json() if response.status == 200 else None
+
+            # Not retried: the upload consumes the spool
+            with span("openrouter.voice_to_text"):
+                data = await call("openrouter", transcribe)
+
+        if data and data.get("text"):
+            await update.message.reply_text(f"🔊 Transcription: {data['text']}")
+        else:
+            await update.message.reply_text("❌ Transcription failed")
+    except FileTooLarge:
+        await update.message.reply_text("❌ File is too large to process")
+    except DownloadError as e:
+        await update.message.reply_text(f"❌ {str(e)}")
+    except CircuitOpenError as e:
+        await update.message.reply_text(f"🚧 {str(e)}")
+    except asyncio.TimeoutError:
+        await update.message.reply_text("⏱️ Transcription timeout. Try again.")
+    except Exception:
+        # Client errors can carry the file URL (and with it the bot token): log, don't echo
+        logger.exception("❌ Voice transcription failed")
+        await update.message.reply_text("❌ Conversion error, please try again later")
+
+async def compress_video_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Compress a replied-to video to a target size in MB or a quality level"""
+    message = update.message.reply_to_message or update.message
+    media = message.video or message.animation or message.document
+    if not media or (message.document and not (media.mime_type or "").startswith("video/")):
+        await update.message.reply_text("❌ Reply to a video with /compress_video [size_mb|high|medium|low]")
+        return
+
+    target_bytes, quality = None, None
+    if context.args:
+        arg = context.args[0].lower()
+        if arg in QUALITY_CRF:
+            quality = arg
+        else:
+            try:
+                size_mb = float(arg)
+            except ValueError:
+                await update.message.reply_text("❌ Usage: /compress_video [size_mb|high|medium|low]")
+                return
+            # float() also accepts inf/nan, which int() can't convert
+            target_bytes = int(size_mb * 1024 * 1024) if math.isfinite(size_mb) else 0
+            if target_bytes <= 0:
+                await update.message.reply_text("❌ Target size must be a positive number of MB")
+                return
+
+    try:
+        # Before get_file(): Telegram's getFile itself fails for files over 20 MB
+        check_size(media)
+        await update.message.reply_text("🎬 Compressing video... this may take a while")
+        video_file = await media.get_file()
+        async with download_to_tempfile(video_file, suffix=".mp4") as src:
+            dst = os.path.join(os.path.dirname(src), "compressed.mp4")
+            info = await compress_video(src, dst, target_bytes=target_bytes, quality=quality,
+                                        cache_key=media.file_unique_id)
+            size_mb = os.path.getsize(dst) / 1024 / 1024
+            with open(dst, "rb") as f:
+                await update.message.reply_video(
+                    video=f, supports_streaming=True, write_timeout=120,
+                    caption=f"✅ {info.size / 1024 / 1024:.1f} MB → {size_mb:.1f} MB",
+                )
+    except FileTooLarge:
+        await update.message.reply_text("❌ File is too large to download (Telegram bots can fetch up to 20 MB)")
+    except DownloadError as e:
+        await update.message.reply_text(f"❌ {str(e)}")
+    except CompressionError as e:
+        await update.message.reply_text(f"❌ Compression failed: {str(e)}")
+    except FileNotFoundError:
+        await update.message.reply_text("❌ FFmpeg not installed. Install from https://ffmpeg.org/")
+    except Exception:
+        logger.exception("❌ Video compression failed")
+        await update.message.reply_text("❌ Compression error, please try again later")
+
+async def model_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Owner-only: show model residency or route a command to a model (/model [command model])"""
+    if update.effective_user.id != BOT_OWNER["user_id"]:
+        await update.message.reply_text("⛔ This command is restricted to the bot owner.")
+        return
+
+    if not context.args:
+        await update.message.reply_text(model_manager.status())
+        return
+    if len(context.args) != 2:
+        await update.message.reply_text("❌ Usage: /model [command model]")
+        return
+
+    command, model = context.args[0].lstrip("/"), context.args[1]
+    try:
+        await model_manager.set_model(command, model)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {str(e)}")
+        return
+    await update.message.reply_text(f"✅ /{command} now uses {model}")
+    # Warm it up so the next request doesn't pay the load cost
+    context.application.create_task(model_manager.preload([model]))
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Owner-only: profile the running bot for N seconds (/profile [seconds] [cprofile|sample])"""
+    if update.effective_user.id != BOT_OWNER["user_id"]:
+        await update.message.reply_text("⛔ This command is restricted to the bot owner.")
+        return
+
+    args = context.args or []
+    try:
+        seconds = min(max(float(args[0]), 1.0), 120.0) if args else 10.0
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /profile [seconds] [cprofile|sample]")
+        return
+    mode = args[1].lower() if len(args) > 1 else "cprofile"
+    if mode not in ("cprofile", "sample"):
+        await update.message.reply_text("❌ Usage: /profile [seconds] [cprofile|sample]")
+        return
+
+    await update.message.reply_text(f"⏳ Profiling ({mode}) for {seconds:.0f}s...")
+    if mode == "sample":
+        report = await profile_sampling(seconds)
+    else:
+        report = await profile_cprofile(seconds)
+    blocked = f"🧱 Loop stalls: {loop_block_detector.stalls} (max {loop_block_detector.max_lag * 1000:.0f}ms)"
+    await update.message.reply_text(f"📈 Top hotspots\n{blocked}\n\n{report}"[:4096])
+
+def register_handlers(application: Application) -> None:
+    """Attach all command handlers to the application"""
+    application.add_handler(CommandHandler("start", traced(start)))
+    application.add_handler(CommandHandler("commands", traced(commands_help)))
+    application.add_handler(CommandHandler("test", traced(test_command)))
+    application.add_handler(CommandHandler("status", traced(status_command)))
+    application.add_handler(CommandHandler("llama", traced(llama_chat)))
+    application.add_handler(CommandHandler("ffmpeg_test", traced(ffmpeg_test)))
+    application.add_handler(CommandHandler("voice_openrouter", traced(openrouter_voice_to_text)))
+    application.add_handler(CommandHandler("compress_video", traced(compress_video_command), block=False))
+    # Not traced: it sleeps for the whole profiling window and would always log as a slow update
+    application.add_handler(CommandHandler("profile", profile_command, block=False))
+    application.add_handler(CommandHandler("model", traced(model_command)))
+
+async def on_startup(application: Application) -> None:
+    """post_init hook: runs inside the bot's event loop before polling starts"""
+    loop_block_detector.start()
+    model_manager.start()
+
+async def on_shutdown(application: Application) -> None:
+    """post_shutdown hook: stop background tasks"""
+    await model_manager.stop()
+    loop_block_detector.stop()
+
+def build_application(token: str = TOKEN, base_url: str = None, base_file_url: str = None,
+                      concurrent_updates=False) -> Application:
+    """Create the bot application (base_url/base_file_url let benchmarks point it at a fake Bot API)"""
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(concurrent_updates)
+        .request(TracingRequest(connection_pool_size=256))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    application = builder.build()
+    register_handlers(application)
+    return application
+
 # Main bot function
 def main():
-    print("🔧 Creating bot application...")
+    logger.info("🔧 Creating bot application...")
     
-    # Create the Application
-    application = Application.builder().token(TOKEN).build()
+    # Create the Application with all command handlers
+    application = build_application()
     
-    print("📝 Adding command handlers...")
-    
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("commands", commands_help))
-    application.add_handler(CommandHandler("test", test_command))
-    application.add_handler(CommandHandler("status", status_command))
-    application.add_handler(CommandHandler("llama", llama_chat))
-    application.add_handler(CommandHandler("ffmpeg_test", ffmpeg_test))
-    
-    print("⚙️ Setting up bot commands...")
+    logger.info("⚙️ Setting up bot commands...")
     
     # Set bot commands for Telegram UI
     async def setup_commands():
@@ -169,29 +421,27 @@ def main():
             BotCommand("test", "Test functionality"),
             BotCommand("status", "Bot status"),
             BotCommand("llama", "Llama AI chat"),
-            BotCommand("ffmpeg_test", "Test FFmpeg")
+            BotCommand("ffmpeg_test", "Test FFmpeg"),
+            BotCommand("voice_openrouter", "Voice-to-text (AI)"),
+            BotCommand("compress_video", "Compress a video")
         ]
         await application.bot.set_my_commands(commands)
-        print("✅ Bot commands configured")
+        logger.info("✅ Bot commands configured")
     
     # Run setup
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     loop.run_until_complete(setup_commands())
     
-    print("🎯 Bot is ready!")
-    print("✅ Send /start or /test in Telegram to verify")
-    print("🛑 Press Ctrl+C to stop")
-    print("-" * 50)
+    logger.info("🎯 Bot is ready! Send /start or /test in Telegram to verify (Ctrl+C to stop)")
     
     # Start polling
     try:
         application.run_polling(drop_pending_updates=True)
     except KeyboardInterrupt:
-        print("\n🛑 Bot stopped by user")
-    except Exception as e:
-        print(f"❌ Bot error: {e}")
-        logger.exception("Bot error")
+        logger.info("🛑 Bot stopped by user")
+    except Exception:
+        logger.exception("❌ Bot error")
 
 if __name__ == "__main__":
     main()